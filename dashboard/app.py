@@ -1,13 +1,26 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
+import plotly.io.json as pio_json
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
 from azure.storage.blob import BlobServiceClient
 import os
+import tempfile
+import time
 from dotenv import load_dotenv
-from io import StringIO
+from io import BytesIO
 import chat_logic
 import yfinance as yf
 
+# Serialize figures with orjson (much faster on large numeric traces) when available
+try:
+    import orjson  # noqa: F401
+    pio_json.config.default_engine = "orjson"
+except ImportError:
+    pass
+
 # Page Config
 st.set_page_config(page_title="FinSight Analyst Portal", layout="wide", page_icon="📈")
 load_dotenv()
@@ -21,76 +34,209 @@ def get_blob_service_client():
         return None
     return BlobServiceClient.from_connection_string(connection_string)
 
+# Narrow dtypes halve what goes through the cache and into Plotly's JSON
+PRICE_DTYPES = {"Open": "float32", "High": "float32", "Low": "float32", "Close": "float32", "Volume": "int32"}
+
+def downcast_prices(df):
+    """Drop incomplete bars and convert OHLCV columns to compact dtypes."""
+    df = df.dropna()
+    return df.astype({c: t for c, t in PRICE_DTYPES.items() if c in df.columns})
+
+# On-disk price cache so new sessions / restarts only fetch the latest bars
+PRICE_CACHE_DIR = os.path.expanduser(os.getenv("FINSIGHT_CACHE_DIR", "~/.finsight_cache"))
+HISTORY = pd.DateOffset(years=2)
+
+def read_price_cache(ticker):
+    """Return the cached bars for a ticker, or an empty DataFrame."""
+    path = os.path.join(PRICE_CACHE_DIR, f"{ticker}.parquet")
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        return pd.DataFrame()
+
+def update_price_cache(ticker, cached, fresh):
+    """Merge freshly downloaded bars into the cache (latest wins) and persist it."""
+    df = pd.concat([cached, fresh]) if not cached.empty else fresh
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    df = df[df.index >= pd.Timestamp.now().normalize() - HISTORY]
+    try:
+        os.makedirs(PRICE_CACHE_DIR, exist_ok=True)
+        # Unique temp file so concurrent sessions never write to the same path
+        fd, tmp_path = tempfile.mkstemp(dir=PRICE_CACHE_DIR, prefix=f"{ticker}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_parquet(tmp_path)
+            os.replace(tmp_path, os.path.join(PRICE_CACHE_DIR, f"{ticker}.parquet"))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    except Exception:
+        pass  # Cache is best-effort
+    return df
+
+# Settled bars re-fetched before the last cached one to detect re-adjusted history
+CACHE_OVERLAP_BARS = 5
+
+def cache_start(cached):
+    """Download start for a ticker: a few settled bars before the last cached one (which may still be live)."""
+    if len(cached) <= CACHE_OVERLAP_BARS:
+        return None
+    return cached.index[-(CACHE_OVERLAP_BARS + 1)]
+
+def cache_matches(cached, fresh):
+    """False if Yahoo re-adjusted the history (split/dividend) since the cached bars were stored."""
+    # Skip the last cached bar: it may have been stored while the session was still live
+    settled = cached.index[:-1].intersection(fresh.index)
+    if settled.empty or "Close" not in fresh.columns:
+        return False
+    return np.allclose(cached.loc[settled, "Close"].to_numpy(dtype=np.float64),
+                       fresh.loc[settled, "Close"].to_numpy(dtype=np.float64), rtol=1e-4)
+
+def select_price_columns(df):
+    """Keep the standard OHLCV columns with a DateTime index."""
+    required_cols = ["Open", "High", "Low", "Close", "Volume"]
+    df = df[[c for c in required_cols if c in df.columns]]
+    df.index = pd.to_datetime(df.index)
+    return df
+
+def download_prices(ticker, **kwargs):
+    """Download one ticker's daily bars as standard OHLCV columns (empty if none)."""
+    df = yf.download(ticker, interval="1d", auto_adjust=True, progress=False, **kwargs)
+    if df.empty:
+        return df
+    # Handle MultiIndex columns if present
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.droplevel(1)
+    return select_price_columns(df)
+
+def split_batch(df, ticker):
+    """One ticker's bars from a grouped multi-ticker download (empty if missing)."""
+    if df.empty:
+        return pd.DataFrame()
+    # Single-ticker downloads may come back without the ticker level
+    if isinstance(df.columns, pd.MultiIndex):
+        if ticker not in df.columns.get_level_values(0):
+            return pd.DataFrame()
+        df = df[ticker]
+    return select_price_columns(df).dropna(how="all")
+
 @st.cache_data(ttl=60) # Cache for 1 min (near real-time)
 def load_data(ticker):
     """Fetch data directly from Yahoo Finance for real-time updates."""
     try:
-        # Download last 2 years of data
-        df = yf.download(ticker, period="2y", interval="1d", auto_adjust=True, progress=False)
-        
+        cached = read_price_cache(ticker)
+        start = cache_start(cached)
+        if start is None:
+            # Download last 2 years of data
+            df = download_prices(ticker, period="2y")
+        else:
+            # Only the bars since shortly before the last cached date
+            df = download_prices(ticker, start=start)
+            if not df.empty and not cache_matches(cached, df):
+                # History was re-adjusted since it was cached; rebuild it from scratch
+                full = download_prices(ticker, period="2y")
+                if not full.empty:
+                    cached, df = pd.DataFrame(), full
+
         if df.empty:
-            return pd.DataFrame()
+            return downcast_prices(cached) if not cached.empty else pd.DataFrame()
 
-        # Handle MultiIndex columns if present
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.droplevel(1)
-            
-        # Ensure standard columns
-        required_cols = ["Open", "High", "Low", "Close", "Volume"]
-        available_cols = [c for c in required_cols if c in df.columns]
-        df = df[available_cols]
-        
-        # Ensure DateTime Index
-        df.index = pd.to_datetime(df.index)
-        return df
+        df = update_price_cache(ticker, cached, df)
+        return downcast_prices(df)
     except Exception as e:
         st.error(f"Error loading {ticker} from Yahoo: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=600)
-def load_insights():
+@st.cache_data(ttl=60)
+def load_data_batch(tickers_tuple):
+    """Fetch several tickers from Yahoo Finance in a single request."""
+    if not tickers_tuple:
+        return {}
+    try:
+        cached = {t: read_price_cache(t) for t in tickers_tuple}
+        starts = [cache_start(c) for c in cached.values()]
+        full_history = any(s is None for s in starts)
+        if full_history:
+            df = yf.download(list(tickers_tuple), period="2y", interval="1d", auto_adjust=True,
+                             progress=False, group_by="ticker", threads=True)
+        else:
+            # One delta request from the oldest start date covers every ticker
+            df = yf.download(list(tickers_tuple), start=min(starts), interval="1d", auto_adjust=True,
+                             progress=False, group_by="ticker", threads=True)
+        fresh = {t: split_batch(df, t) for t in tickers_tuple}
+
+        if not full_history:
+            # Tickers whose history was re-adjusted since caching are rebuilt from scratch
+            stale = [t for t in tickers_tuple if not fresh[t].empty and not cache_matches(cached[t], fresh[t])]
+            if stale:
+                df = yf.download(stale, period="2y", interval="1d", auto_adjust=True,
+                                 progress=False, group_by="ticker", threads=True)
+                for t in stale:
+                    full = split_batch(df, t)
+                    if not full.empty:
+                        cached[t], fresh[t] = pd.DataFrame(), full
+
+        data = {}
+        for t in tickers_tuple:
+            df_t = fresh[t]
+            if not df_t.empty:
+                df_t = update_price_cache(t, cached[t], df_t)
+            else:
+                df_t = cached[t]
+            df_t = downcast_prices(df_t)
+            if df_t.empty:
+                continue
+            data[t] = df_t
+        return data
+    except Exception as e:
+        st.error(f"Error loading {', '.join(tickers_tuple)} from Yahoo: {e}")
+        return {}
+
+@st.cache_resource
+def get_blob_etag_cache():
+    """Process-wide {blob_name: (etag, DataFrame)} for conditional blob reads."""
+    return {}
+
+def load_blob_csv(blob_name, dtype=None):
+    """Read a CSV blob, skipping the download (HTTP 304) when its ETag hasn't changed."""
     client = get_blob_service_client()
     if not client: return pd.DataFrame()
     
     try:
         container = os.getenv("PROCESSED_CONTAINER_NAME", "processeddata")
-        blob_client = client.get_blob_client(container=container, blob="ai_insights.csv")
-        if not blob_client.exists(): return pd.DataFrame()
+        blob_client = client.get_blob_client(container=container, blob=blob_name)
+        cache = get_blob_etag_cache()
+        cached = cache.get(blob_name)
         
-        download_stream = blob_client.download_blob()
-        return pd.read_csv(StringIO(download_stream.content_as_text()))
+        try:
+            if cached:
+                download_stream = blob_client.download_blob(etag=cached[0], match_condition=MatchConditions.IfModified)
+            else:
+                download_stream = blob_client.download_blob()
+        except ResourceNotModifiedError:
+            return cached[1]
+        except ResourceNotFoundError:
+            return pd.DataFrame()
+        
+        df = pd.read_csv(BytesIO(download_stream.readall()), dtype=dtype, engine="c")
+        cache[blob_name] = (download_stream.properties.etag, df)
+        return df
     except:
         return pd.DataFrame()
 
+@st.cache_data(ttl=600)
+def load_insights():
+    return load_blob_csv("ai_insights.csv", dtype={"Ticker": "category"})
+
 @st.cache_data(ttl=600)
 def load_predictions():
-    client = get_blob_service_client()
-    if not client: return pd.DataFrame()
-    
-    try:
-        container = os.getenv("PROCESSED_CONTAINER_NAME", "processeddata")
-        blob_client = client.get_blob_client(container=container, blob="lstm_predictions.csv")
-        if not blob_client.exists(): return pd.DataFrame()
-        
-        download_stream = blob_client.download_blob()
-        return pd.read_csv(StringIO(download_stream.content_as_text()))
-    except:
-        return pd.DataFrame()
+    return load_blob_csv("lstm_predictions.csv", dtype={"Ticker": "category", "Direction": "category"})
 
 @st.cache_data(ttl=600)
 def load_sentiment():
-    client = get_blob_service_client()
-    if not client: return pd.DataFrame()
-    
-    try:
-        container = os.getenv("PROCESSED_CONTAINER_NAME", "processeddata")
-        blob_client = client.get_blob_client(container=container, blob="sentiment_analysis.csv")
-        if not blob_client.exists(): return pd.DataFrame()
-        
-        download_stream = blob_client.download_blob()
-        return pd.read_csv(StringIO(download_stream.content_as_text()))
-    except:
-        return pd.DataFrame()
+    return load_blob_csv("sentiment_analysis.csv")
 
 # --- MAIN UI ---
 st.title("📈 FinSight Analyst Portal")
@@ -193,10 +339,9 @@ if view_mode == "Deep Dive":
         
         # Prepare Market Context for Comparison
         market_context_str = ""
-        for t in tickers:
-            if t == selected_ticker: continue # skip current
-            d_t = load_data(t)
-            if not d_t.empty:
+        peer_data = load_data_batch(tuple(t for t in tickers if t != selected_ticker))
+        for t, d_t in peer_data.items():
+            if len(d_t) > 1:
                 l_t = d_t.iloc[-1]['Close']
                 p_t = d_t.iloc[-2]['Close']
                 c_pct = ((l_t - p_t) / p_t) * 100
@@ -231,11 +376,12 @@ else:
         st.warning("Please select at least one ticker.")
     else:
         # Load all data
-        comp_data = {}
-        for t in selected_tickers:
-            df_t = load_data(t)
-            if not df_t.empty:
-                comp_data[t] = df_t
+        # Keep the assembled data in the session; refresh on ticker change or once a minute
+        comp_key = (tuple(selected_tickers), int(time.time() // 60))
+        cached_comp = st.session_state.get("comp_data")
+        if cached_comp is None or cached_comp[0] != comp_key:
+            st.session_state["comp_data"] = (comp_key, load_data_batch(tuple(selected_tickers)))
+        comp_data = st.session_state["comp_data"][1]
         
         if not comp_data:
             st.error("No data available for selected tickers.")
@@ -246,10 +392,12 @@ else:
             
             for t, df_t in comp_data.items():
                 if len(df_t) > 0:
-                    # Normalize to first day = 0%
-                    start_price = df_t['Close'].iloc[0]
-                    norm_series = ((df_t['Close'] - start_price) / start_price) * 100
-                    fig_comp.add_trace(go.Scatter(x=df_t.index, y=norm_series, mode='lines', name=t))
+                    # Normalize to first day of the window = 0%
+                    window = df_t.iloc[-60:]
+                    close = window['Close'].to_numpy(dtype=np.float32, copy=False)
+                    norm = (close - close[0]) * (100.0 / close[0])
+                    # WebGL traces stay responsive with many overlaid tickers
+                    fig_comp.add_trace(go.Scattergl(x=window.index, y=norm, mode='lines', name=t))
 
             fig_comp.update_layout(
                 title="Relative Performance Comparison (%)",
@@ -264,7 +412,7 @@ else:
             st.caption("Trading Volume Comparison")
             fig_vol_comp = go.Figure()
             for t, df_t in comp_data.items():
-                fig_vol_comp.add_trace(go.Bar(x=df_t.index, y=df_t['Volume'], name=t))
+                fig_vol_comp.add_trace(go.Bar(x=df_t.index, y=df_t['Volume'].values, name=t))
             
             fig_vol_comp.update_layout(title="Volume Comparison", barmode='group', height=400)
             st.plotly_chart(fig_vol_comp, use_container_width=True)
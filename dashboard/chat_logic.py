@@ -1,5 +1,10 @@
 import os
 import logging
+import hashlib
+import json
+import shelve
+import threading
+import numpy as np
 import pandas as pd
 from openai import OpenAI
 
@@ -10,6 +15,33 @@ def get_openai_client():
         return None
     return OpenAI(api_key=api_key)
 
+# Disk cache of chat completions (see cached_chat_completion). The dashboard is deployed without
+# etl_pipeline, so it keeps its own file instead of sharing the ETL's OpenAI cache.
+CHAT_CACHE_PATH = os.getenv("CHAT_CACHE_PATH", "/tmp/finsight_chat.cache")
+_CHAT_CACHE_LOCK = threading.Lock()
+
+def cached_chat_completion(client, model, messages, max_tokens, key_payload):
+    """
+    Return a completion, reusing a cached answer for the same key_payload.
+    key_payload should capture what determines the answer without volatile context.
+    """
+    key = hashlib.sha1(json.dumps({"m": model, "k": key_payload, "mt": max_tokens}, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    try:
+        with _CHAT_CACHE_LOCK, shelve.open(CHAT_CACHE_PATH) as db:
+            if key in db:
+                return db[key]
+    except Exception as e:
+        logging.warning(f"Chat cache read failed: {e}")
+
+    response = client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens)
+    content = response.choices[0].message.content
+    try:
+        with _CHAT_CACHE_LOCK, shelve.open(CHAT_CACHE_PATH) as db:
+            db[key] = content
+    except Exception as e:
+        logging.warning(f"Chat cache write failed: {e}")
+    return content
+
 SYSTEM_PROMPT = """You are FinBot, an expert financial analyst assistant. 
 You are embedded in a dashboard called 'FinSight'.
 Your goal is to help the user understand the stock data, charts, and trends presented to them.
@@ -18,26 +50,49 @@ If you don't know the answer, admit it.
 Do not give financial advice (e.g., 'Buy now!'). Instead say 'The trend is bullish'.
 """
 
-def calculate_technicals(df: pd.DataFrame):
+# (ticker, last bar date, bar count, last close) -> technicals text. Cheap scalars identify the
+# window; the last close is included because the live bar updates intraday.
+_TECHNICALS_CACHE = {}
+_TECHNICALS_CACHE_SIZE = 128
+
+def calculate_technicals(df: pd.DataFrame, ticker=None):
     """
     Simple 'Graph Vision' - calculates support, resistance, and trend.
+    Memoized per ticker window when `ticker` is given.
     """
     if df.empty: return "No data available."
-    
-    last_close = df["Close"].iloc[-1]
-    max_price = df["High"].max()
-    min_price = df["Low"].min()
+
+    key = (ticker, df.index[-1], len(df), float(df["Close"].iat[-1])) if ticker else None
+    if key is not None and key in _TECHNICALS_CACHE:
+        return _TECHNICALS_CACHE[key]
+
+    close = df["Close"].to_numpy(dtype=np.float64)
+    last_close = close[-1]
+    max_price = df["High"].to_numpy(dtype=np.float64).max()
+    min_price = df["Low"].to_numpy(dtype=np.float64).min()
     
     # Simple Trend (Price vs 20-day MA)
-    ma_20 = df["Close"].rolling(20).mean().iloc[-1] if len(df) >= 20 else last_close
+    ma_20 = close[-20:].mean() if len(close) >= 20 else last_close
     trend = "BULLISH" if last_close > ma_20 else "BEARISH"
     
-    return f"""
+    technicals = f"""
     - Current Price: ${last_close:.2f}
     - 60-Day High (Resistance): ${max_price:.2f}
     - 60-Day Low (Support): ${min_price:.2f}
     - Technical Trend: {trend} (Price vs 20-MA)
     """
+    if key is not None:
+        if len(_TECHNICALS_CACHE) >= _TECHNICALS_CACHE_SIZE:
+            _TECHNICALS_CACHE.pop(next(iter(_TECHNICALS_CACHE), None), None)
+        _TECHNICALS_CACHE[key] = technicals
+    return technicals
+
+def summarize_recent(df: pd.DataFrame, n=5):
+    """Compact 'date:C=close,V=volume' summary of the last n bars for the prompt."""
+    tail = df.tail(n)
+    return "; ".join(
+        f"{d:%Y-%m-%d}:C={c:.2f},V={v:.0f}" for d, c, v in zip(tail.index, tail["Close"], tail["Volume"])
+    )
 
 def generate_chat_response(messages, current_ticker, recent_data: pd.DataFrame, prediction=None, market_context=None, sentiment_context=None):
     """
@@ -53,11 +108,11 @@ def generate_chat_response(messages, current_ticker, recent_data: pd.DataFrame,
     
     if not recent_data.empty:
         # 1. Technical 'Graph Vision'
-        technicals = calculate_technicals(recent_data)
+        technicals = calculate_technicals(recent_data, current_ticker)
         context += f"\nTECHNICAL ANALYSIS (Visual Trends):\n{technicals}\n"
         
         # Data Dump (Still useful for specific numbers)
-        context += f"\nLatest Data (Last 5 Days):\n{recent_data.tail(5).to_string()}\n"
+        context += f"\nLatest Data (Last 5 Days):\n{summarize_recent(recent_data)}\n"
     
     if prediction:
         context += f"\nAI PREDICTION (LSTM Model):\nTomorrow's Price: ${prediction['price']:.2f} ({prediction['direction']})\n"
@@ -75,11 +130,11 @@ def generate_chat_response(messages, current_ticker, recent_data: pd.DataFrame,
     full_messages.extend(messages)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=full_messages,
-            max_tokens=400
+        # Key on ticker + latest bar + conversation, not the technicals block that's rebuilt each turn
+        last_bar = recent_data.index[-1] if not recent_data.empty else None
+        return cached_chat_completion(
+            client, "gpt-4o-mini", full_messages, 400,
+            key_payload={"ticker": current_ticker, "last_bar": last_bar, "messages": messages}
         )
-        return response.choices[0].message.content
     except Exception as e:
         return f"FinBot Error: {str(e)}"
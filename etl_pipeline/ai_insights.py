@@ -1,13 +1,28 @@
 import os
+import csv
+import asyncio
 import logging
 import pandas as pd
 import numpy as np
-from io import StringIO
+from io import BytesIO, TextIOWrapper
 from azure.storage.blob import BlobServiceClient
+from .blob_cache import download_blob_bytes
+from .config import get_tickers
+from .openai_cache import cached_completion, cached_completion_async
+
+try:
+    from numba import njit
+except ImportError:
+    logging.warning("Numba not installed. Insight stats will run in pure Python.")
+    def njit(*args, **kwargs):
+        return lambda func: func
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Only these columns of {ticker}_processed.parquet are needed for insights
+INSIGHT_COLUMNS = ["Date", "Close", "return_pct", "Volume"]
+
 def get_openai_client():
     """Lazy load OpenAI client to avoid errors if not installed/configured."""
     try:
@@ -20,18 +35,62 @@ def get_openai_client():
         logging.warning("OpenAI library not installed. Using local fallback.")
         return None
 
+def get_async_openai_client():
+    """Lazy load the async OpenAI client, or None if not installed/configured."""
+    try:
+        from openai import AsyncOpenAI
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        return AsyncOpenAI(api_key=api_key)
+    except ImportError:
+        logging.warning("OpenAI library not installed. Using local fallback.")
+        return None
+
+@njit(cache=True)
+def _insight_stats(close, ret_pct, volume):
+    """Latest/previous close, return std (ddof=1) and mean volume in one pass, skipping NaNs like pandas."""
+    n = close.shape[0]
+    latest_close = close[n - 1]
+    prev_close = close[n - 2] if n > 1 else latest_close
+
+    r_count = 0
+    r_sum = 0.0
+    r_sq_sum = 0.0
+    v_count = 0
+    v_sum = 0.0
+    for i in range(n):
+        r = ret_pct[i]
+        if not np.isnan(r):
+            r_count += 1
+            r_sum += r
+            r_sq_sum += r * r
+        v = volume[i]
+        if not np.isnan(v):
+            v_count += 1
+            v_sum += v
+
+    std = np.nan
+    if r_count > 1:
+        mean = r_sum / r_count
+        std = np.sqrt(max((r_sq_sum - r_count * mean * mean) / (r_count - 1), 0.0))
+    avg_volume = v_sum / v_count if v_count > 0 else np.nan
+    return latest_close, prev_close, std, avg_volume
+
 def generate_local_insight(df: pd.DataFrame, ticker: str) -> str:
     """Generate a template-based insight using pandas stats (Fallback)."""
     if df.empty:
         return f"{ticker}: No data available for insight."
     
     # Calculate stats
-    latest_close = df["Close"].iloc[-1]
-    prev_close = df["Close"].iloc[-2] if len(df) > 1 else latest_close
+    latest_close, prev_close, return_std, avg_volume = _insight_stats(
+        df["Close"].to_numpy(dtype=np.float64),
+        df["return_pct"].to_numpy(dtype=np.float64),
+        df["Volume"].to_numpy(dtype=np.float64),
+    )
     daily_return = ((latest_close - prev_close) / prev_close) * 100
     
-    volatility = df["return_pct"].std() * 100
-    avg_volume = df["Volume"].mean()
+    volatility = return_std * 100
     
     trend = "bullish" if daily_return > 0 else "bearish"
     vol_desc = "high" if volatility > 2.0 else "stable"
@@ -43,81 +102,125 @@ def generate_local_insight(df: pd.DataFrame, ticker: str) -> str:
     )
     return insight
 
-def generate_openai_insight(client, df: pd.DataFrame, ticker: str) -> str:
-    """Generate a natural language insight using OpenAI GPT-4o-mini."""
-    if df.empty:
-        return f"{ticker}: No data available."
-    
+def summarize_recent(df: pd.DataFrame, n=5) -> str:
+    """Compact 'date:C=close,V=volume' summary of the last n rows for the prompt."""
+    tail = df.tail(n)
+    return "; ".join(
+        f"{d:%Y-%m-%d}:C={c:.2f},V={v:.0f}" for d, c, v in zip(tail.index, tail["Close"], tail["Volume"])
+    )
+
+def build_insight_messages(df: pd.DataFrame, ticker: str) -> list:
+    """Chat messages asking for a one-sentence insight on the recent data."""
     # Summarize last 5 days as context
-    recent_data = df.tail(5).to_string()
+    recent_data = summarize_recent(df)
     
     prompt = (
         f"Analyze the following recent stock data for {ticker}:\n\n{recent_data}\n\n"
         "Provide a concise, 1-sentence financial insight suitable for a dashboard. "
         "Focus on trend, volatility, and volume. Do not use markdown."
     )
+    return [
+        {"role": "system", "content": "You are a financial analyst bot."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_openai_insight(client, df: pd.DataFrame, ticker: str) -> str:
+    """Generate a natural language insight using OpenAI GPT-4o-mini."""
+    if df.empty:
+        return f"{ticker}: No data available."
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a financial analyst bot."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=60
-        )
-        return response.choices[0].message.content.strip()
+        content = cached_completion(client, "gpt-4o-mini", build_insight_messages(df, ticker), max_tokens=60)
+        return content.strip()
     except Exception as e:
         logging.error(f"OpenAI generation failed for {ticker}: {e}")
         return generate_local_insight(df, ticker)
 
-def run_ai_pipeline(blob_service_client: BlobServiceClient, processed_container: str):
-    """Main function to generate insights for all tickers and upload to Azure."""
-    logging.info("Starting AI Insight Generation...")
+async def generate_openai_insight_async(aclient, df: pd.DataFrame, ticker: str) -> str:
+    """Async variant of generate_openai_insight for use with AsyncOpenAI."""
+    if df.empty:
+        return f"{ticker}: No data available."
     
+    try:
+        content = await cached_completion_async(aclient, "gpt-4o-mini", build_insight_messages(df, ticker), max_tokens=60)
+        return content.strip()
+    except Exception as e:
+        logging.error(f"OpenAI generation failed for {ticker}: {e}")
+        return generate_local_insight(df, ticker)
+
+def download_processed_data(blob_service_client: BlobServiceClient, processed_container: str, ticker: str):
+    """Download the columns needed for insights from {ticker}_processed.parquet, or None if missing."""
+    # Download processed data from Azure (or use local if integrated, but let's fetch to be safe/stateless)
+    blob_name = f"{ticker}_processed.parquet"
+    content = download_blob_bytes(blob_service_client, processed_container, blob_name)
+    
+    if content is None:
+        logging.warning(f"Blob {blob_name} not found. Skipping.")
+        return None
+
+    return pd.read_parquet(BytesIO(content), columns=INSIGHT_COLUMNS).set_index("Date")
+
+async def _insight_for_ticker(aclient, blob_service_client: BlobServiceClient, processed_container: str, ticker: str):
+    try:
+        # Blob SDK is sync; run it in a thread so downloads overlap with OpenAI requests
+        df = await asyncio.to_thread(download_processed_data, blob_service_client, processed_container, ticker)
+        if df is None:
+            return None
+        
+        if aclient:
+            insight_text = await generate_openai_insight_async(aclient, df, ticker)
+        else:
+            insight_text = generate_local_insight(df, ticker)
+        
+        logging.info(f"Generated insight for {ticker}")
+        return {"Ticker": ticker, "Insight": insight_text, "Date": pd.Timestamp.now().strftime("%Y-%m-%d")}
+        
+    except Exception as e:
+        logging.error(f"Error processing insights for {ticker}: {e}")
+        return None
+
+async def _generate_all_insights(blob_service_client: BlobServiceClient, processed_container: str, tickers: list):
     # Check for OpenAI Key
-    client = get_openai_client()
-    mode = "OpenAI" if client else "Local Fallback"
+    aclient = get_async_openai_client()
+    mode = "OpenAI" if aclient else "Local Fallback"
     logging.info(f"AI Mode: {mode}")
 
-    tickers_str = os.getenv("STOCK_TICKERS", "AAPL,MSFT,TSLA,GOOGL,AMZN")
-    tickers = [t.strip() for t in tickers_str.split(",") if t.strip()]
+    try:
+        return await asyncio.gather(
+            *[_insight_for_ticker(aclient, blob_service_client, processed_container, t) for t in tickers]
+        )
+    finally:
+        if aclient:
+            await aclient.close()
+
+def run_ai_pipeline(blob_service_client: BlobServiceClient, processed_container: str):
+    """Main function to generate insights for all tickers and upload to Azure."""
+    logging.info("Starting AI Insight Generation...")
     
-    insights = []
-
-    for ticker in tickers:
-        try:
-            # Download processed data from Azure (or use local if integrated, but let's fetch to be safe/stateless)
-            blob_name = f"{ticker}_processed.csv"
-            blob_client = blob_service_client.get_blob_client(container=processed_container, blob=blob_name)
-            
-            if not blob_client.exists():
-                logging.warning(f"Blob {blob_name} not found. Skipping.")
-                continue
-
-            download_stream = blob_client.download_blob()
-            df = pd.read_csv(StringIO(download_stream.content_as_text()), index_col=0)
-            
-            if client:
-                insight_text = generate_openai_insight(client, df, ticker)
-            else:
-                insight_text = generate_local_insight(df, ticker)
-            
-            insights.append({"Ticker": ticker, "Insight": insight_text, "Date": pd.Timestamp.now().strftime("%Y-%m-%d")})
-            logging.info(f"Generated insight for {ticker}")
-            
-        except Exception as e:
-            logging.error(f"Error processing insights for {ticker}: {e}")
-
-    # Save to CSV
-    if insights:
-        insights_df = pd.DataFrame(insights)
-        output = StringIO()
-        insights_df.to_csv(output, index=False)
+    tickers = list(get_tickers())
+    
+    # All downloads and OpenAI requests run concurrently on one event loop
+    results = asyncio.run(_generate_all_insights(blob_service_client, processed_container, tickers))
+
+    # Save to CSV, writing rows straight into the upload buffer
+    output = BytesIO()
+    text_output = None
+    writer = None
+    for row in results:
+        if not row:
+            continue
+        if writer is None:
+            text_output = TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+            writer = csv.DictWriter(text_output, fieldnames=list(row.keys()), lineterminator="\n")
+            writer.writeheader()
+        writer.writerow(row)
+
+    if writer:
+        text_output.detach()  # Leave `output` open for getvalue()
         
         # Upload insights.csv
         target_blob_client = blob_service_client.get_blob_client(container=processed_container, blob="ai_insights.csv")
-        target_blob_client.upload_blob(output.getvalue().encode("utf-8"), overwrite=True)
+        target_blob_client.upload_blob(output.getvalue(), overwrite=True)
         logging.info("Successfully uploaded ai_insights.csv to Azure.")
     else:
         logging.warning("No insights generated.")
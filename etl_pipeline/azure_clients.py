@@ -0,0 +1,17 @@
+import os
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+
+# The insight, LSTM and news stages hit one client from several threads. requests keeps only
+# 10 connections per host by default, so size the pool to reuse kept-alive TLS connections.
+POOL_SIZE = int(os.getenv("AZURE_HTTP_POOL_SIZE", "32"))
+
+def create_blob_service_client(connection_string: str) -> BlobServiceClient:
+    """BlobServiceClient over a pooled keep-alive HTTP session."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    transport = RequestsTransport(session=session, session_owner=False)
+    return BlobServiceClient.from_connection_string(connection_string, transport=transport)
@@ -0,0 +1,38 @@
+import logging
+import threading
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
+from azure.storage.blob import BlobServiceClient
+
+# (container, blob) -> (etag, content). Lives as long as the (warm) worker process.
+_CACHE = {}
+_LOCK = threading.Lock()
+
+def download_blob_bytes(blob_service_client: BlobServiceClient, container: str, blob_name: str, max_concurrency=4):
+    """
+    Download a blob's bytes, reusing the cached copy when its ETag is unchanged.
+    Returns None if the blob does not exist.
+    """
+    key = (container, blob_name)
+    with _LOCK:
+        cached = _CACHE.get(key)
+
+    blob_client = blob_service_client.get_blob_client(container=container, blob=blob_name)
+    try:
+        if cached:
+            # Conditional GET: the service answers 304 without a body if nothing changed
+            download_stream = blob_client.download_blob(
+                max_concurrency=max_concurrency, etag=cached[0], match_condition=MatchConditions.IfModified
+            )
+        else:
+            download_stream = blob_client.download_blob(max_concurrency=max_concurrency)
+    except ResourceNotModifiedError:
+        logging.info(f"Blob {blob_name} unchanged, using cached copy.")
+        return cached[1]
+    except ResourceNotFoundError:
+        return None
+
+    content = download_stream.readall()
+    with _LOCK:
+        _CACHE[key] = (download_stream.properties.etag, content)
+    return content
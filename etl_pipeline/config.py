@@ -0,0 +1,8 @@
+import functools
+import os
+
+@functools.lru_cache(maxsize=1)
+def get_tickers() -> tuple:
+    """Tickers from STOCK_TICKERS, parsed once per process."""
+    tickers_str = os.getenv("STOCK_TICKERS", "AAPL,MSFT,TSLA,GOOGL,AMZN")
+    return tuple(t.strip() for t in tickers_str.split(",") if t.strip())
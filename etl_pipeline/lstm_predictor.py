@@ -1,66 +1,216 @@
+import csv
+import hashlib
+import json
 import logging
 import os
+import re
+import tempfile
 import pandas as pd
 import numpy as np
-from io import StringIO
+from numpy.lib.stride_tricks import sliding_window_view
+from io import BytesIO, TextIOWrapper
+from concurrent.futures import ThreadPoolExecutor
 from azure.storage.blob import BlobServiceClient
-from sklearn.preprocessing import MinMaxScaler
+from .blob_cache import download_blob_bytes
+from .config import get_tickers
 
 # NOTICE: TensorFlow imports removed from top-level to prevent Serverless Cold-Start timeouts.
 # They are now lazy-loaded inside the functions that need them.
+_TF = None
+
+LOOK_BACK = 60
+
+# Keras dtype policy. float32 by default: bf16 keeps ~3 significant digits, enough to flip
+# the UP/DOWN call, and is emulated (slower) on CPUs without native BF16.
+# Opt in with LSTM_PRECISION=mixed_bfloat16 on BF16-capable CPUs, or mixed_float16 on GPU.
+PRECISION_POLICY = os.getenv("LSTM_PRECISION", "float32")
+
+# Everything besides the data that determines a trained model; part of the model cache key
+MODEL_SIGNATURE = f"lstm50-dense25-dense1:look_back={LOOK_BACK}:policy={PRECISION_POLICY}"
+
+def _get_tf():
+    """Import TensorFlow once per process and configure its thread pool."""
+    global _TF
+    if _TF is None:
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(os.cpu_count() or 1)
+        except RuntimeError:
+            # Runtime already initialized elsewhere; keep its settings
+            pass
+        tf.keras.mixed_precision.set_global_policy(PRECISION_POLICY)
+        _TF = tf
+    return _TF
+
+def build_model(look_back=LOOK_BACK):
+    """Build and compile the LSTM once; reuse it across tickers via reset_model."""
+    tf = _get_tf()
+    # Changing the layers? Update MODEL_SIGNATURE so cached models are retrained
+    model = tf.keras.models.Sequential()
+    model.add(tf.keras.layers.LSTM(50, return_sequences=False, input_shape=(look_back, 1)))
+    model.add(tf.keras.layers.Dense(25))
+    # Keep the regression output in float32 under mixed precision
+    model.add(tf.keras.layers.Dense(1, dtype="float32"))
+    model.compile(optimizer='adam', loss='mean_squared_error', jit_compile=True)
+    return model
+
+# Optimizer variables that are settings rather than per-run state (the learning rate, and the
+# loss scale under mixed_float16); zeroing them would stop training
+_KEPT_OPTIMIZER_VARS = ("learning_rate", "loss_scale", "good_steps")
+
+def reset_model(model, initial_weights):
+    """Restore initial weights and clear Adam's moments and step count so the next ticker trains from scratch.
+
+    The model stays compiled, so its traced (XLA) train and predict steps are reused.
+    """
+    tf = _get_tf()
+    model.set_weights(initial_weights)
+    optimizer_vars = model.optimizer.variables
+    for var in (optimizer_vars() if callable(optimizer_vars) else optimizer_vars):
+        if any(name in var.name for name in _KEPT_OPTIMIZER_VARS):
+            continue
+        var.assign(tf.zeros_like(var))
 
 def create_dataset(dataset, look_back=60):
     """Convert an array of values into a dataset matrix."""
-    X, Y = [], []
-    for i in range(len(dataset) - look_back - 1):
-        a = dataset[i:(i + look_back), 0]
-        X.append(a)
-        Y.append(dataset[i + look_back, 0])
-    return np.array(X), np.array(Y)
-
-def train_and_predict(df: pd.DataFrame, ticker: str):
-    """Train a simple LSTM and predict the next day's price."""
-    # Lazy Import TensorFlow here
-    import tensorflow as tf
-    from tensorflow.keras.models import Sequential
-    from tensorflow.keras.layers import LSTM, Dense
-    from tensorflow.keras.callbacks import EarlyStopping
-    import numpy as np
-    
+    arr = dataset[:, 0]
+    if len(arr) < look_back + 2:
+        return np.empty((0, look_back), dtype=arr.dtype), np.empty(0, dtype=arr.dtype)
+
+    # Zero-copy sliding windows; drop the last two so every window has a target
+    windows = sliding_window_view(arr, look_back)
+    X = windows[:-2]
+    Y = arr[look_back:-1]
+    return X, Y
+
+def _model_blob_names(ticker: str, data_hash: str):
+    """Blob names for the cached model and its scaler parameters."""
+    base = f"models/{ticker}_{data_hash}"
+    return f"{base}.keras", f"{base}_scaler.json"
+
+def load_cached_model(blob_service_client: BlobServiceClient, container: str, ticker: str, data_hash: str):
+    """Return (model, scaler_params) trained on identical data, or None if not cached."""
+    tf = _get_tf()
+
+    model_name, scaler_name = _model_blob_names(ticker, data_hash)
+    model_blob = blob_service_client.get_blob_client(container=container, blob=model_name)
+    scaler_blob = blob_service_client.get_blob_client(container=container, blob=scaler_name)
+    if not (model_blob.exists() and scaler_blob.exists()):
+        return None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "model.keras")
+        with open(model_path, "wb") as f:
+            f.write(model_blob.download_blob().readall())
+        model = tf.keras.models.load_model(model_path)
+
+    scaler_params = json.loads(scaler_blob.download_blob().readall())
+    return model, scaler_params
+
+def save_cached_model(blob_service_client: BlobServiceClient, container: str, ticker: str, data_hash: str, model, scaler_params: dict):
+    """Upload a trained model and its scaler parameters keyed by data hash."""
+    model_name, scaler_name = _model_blob_names(ticker, data_hash)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "model.keras")
+        model.save(model_path)
+        with open(model_path, "rb") as f:
+            blob_service_client.get_blob_client(container=container, blob=model_name).upload_blob(f, overwrite=True)
+
+    blob_service_client.get_blob_client(container=container, blob=scaler_name).upload_blob(
+        json.dumps(scaler_params).encode("utf-8"), overwrite=True
+    )
+
+    # Blobs are keyed by data hash, so every retrain leaves the previous pair behind
+    try:
+        _prune_cached_models(blob_service_client, container, ticker, data_hash)
+    except Exception as e:
+        logging.warning(f"Could not prune old LSTM models for {ticker}: {e}")
+
+def _prune_cached_models(blob_service_client: BlobServiceClient, container: str, ticker: str, data_hash: str):
+    """Delete this ticker's models (and scalers) trained on older data."""
+    # Exact match so pruning "A" never touches "AAPL" or "A_B" blobs
+    pattern = re.compile(rf"models/{re.escape(ticker)}_([0-9a-f]{{12}})(\.keras|_scaler\.json)")
+    container_client = blob_service_client.get_container_client(container)
+    for blob in container_client.list_blobs(name_starts_with=f"models/{ticker}_"):
+        match = pattern.fullmatch(blob.name)
+        if not match or match.group(1) == data_hash:
+            continue
+        try:
+            container_client.delete_blob(blob.name)
+        except Exception as e:
+            logging.warning(f"Could not delete stale model blob {blob.name}: {e}")
+
+def train_and_predict(df: pd.DataFrame, ticker: str, blob_service_client: BlobServiceClient = None, container: str = None,
+                      get_model=None):
+    """Train a simple LSTM and predict the next day's price.
+
+    If a blob client is given, models are cached per (ticker, data hash) so
+    unchanged data skips retraining. Pass `get_model`, returning a shared
+    (model, initial_weights) from build_model, to avoid rebuilding per ticker.
+    """
     # Ensure we have enough data
     if len(df) < 100:
         logging.warning(f"Not enough data to train LSTM for {ticker}. Need > 100 rows.")
         return None
 
-    data = df["Close"].values.reshape(-1, 1)
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(data)
+    data = df["Close"].to_numpy(dtype=np.float32).reshape(-1, 1)
+    look_back = LOOK_BACK
 
-    # Train/Test Split logic (simplified for retraining on full data for next-day prediction)
-    look_back = 60
-    X_train, y_train = create_dataset(scaled_data, look_back)
-    
-    if len(X_train) == 0:
-        return None
+    use_cache = blob_service_client is not None and container is not None
+    data_hash = hashlib.sha1(
+        MODEL_SIGNATURE.encode("utf-8") + np.ascontiguousarray(df["Close"].values).tobytes()
+    ).hexdigest()[:12]
 
-    # Reshape input to be [samples, time steps, features]
-    X_train = np.reshape(X_train, (X_train.shape[0], X_train.shape[1], 1))
+    cached = None
+    if use_cache:
+        try:
+            cached = load_cached_model(blob_service_client, container, ticker, data_hash)
+        except Exception as e:
+            logging.warning(f"Could not load cached model for {ticker}: {e}")
 
-    # Build Model
-    model = Sequential()
-    model.add(LSTM(50, return_sequences=False, input_shape=(look_back, 1)))
-    model.add(Dense(25))
-    model.add(Dense(1))
-    
-    # Compile & Train (Fast training for demo)
-    model.compile(optimizer='adam', loss='mean_squared_error')
-    model.fit(X_train, y_train, batch_size=32, epochs=3, verbose=0) 
+    if cached:
+        model, scaler_params = cached
+        logging.info(f"Reusing cached LSTM model for {ticker} ({data_hash})")
+    else:
+        # Min-max scaling to [0, 1], same parameters MinMaxScaler would fit
+        dmin, dmax = float(data.min()), float(data.max())
+        scale = 1.0 / (dmax - dmin) if dmax > dmin else 1.0
+        scaler_params = {"min": -dmin * scale, "scale": scale}
+
+    scaled_data = data * scaler_params["scale"] + scaler_params["min"]
+
+    if not cached:
+        # Train/Test Split logic (simplified for retraining on full data for next-day prediction)
+        X_train, y_train = create_dataset(scaled_data, look_back)
+        
+        if len(X_train) == 0:
+            return None
+
+        # Reshape input to be [samples, time steps, features]
+        X_train = X_train[..., None]
+
+        # Reuse the shared compiled model when given, otherwise build one
+        if get_model is None:
+            model = build_model(look_back)
+        else:
+            model, initial_weights = get_model()
+            reset_model(model, initial_weights)
+        
+        # Train (Fast training for demo)
+        model.fit(X_train, y_train, batch_size=32, epochs=3, verbose=0) 
+
+        if use_cache:
+            try:
+                save_cached_model(blob_service_client, container, ticker, data_hash, model, scaler_params)
+            except Exception as e:
+                logging.warning(f"Could not cache LSTM model for {ticker}: {e}")
 
     # Predict Next Day
     last_60_days = scaled_data[-look_back:]
     X_test = np.reshape(last_60_days, (1, look_back, 1))
-    predicted_scaled = model.predict(X_test, verbose=0)
-    prediction = scaler.inverse_transform(predicted_scaled)
+    predicted_scaled = model.predict(X_test, verbose=0).astype(np.float64)
+    prediction = (predicted_scaled - scaler_params["min"]) / scaler_params["scale"]
     
     return float(prediction[0][0])
 
@@ -68,49 +218,81 @@ def run_lstm_pipeline(blob_service_client: BlobServiceClient, processed_containe
     """Run LSTM predictions for all tickers."""
     logging.info("Starting LSTM Prediction Pipeline...")
     
-    tickers_str = os.getenv("STOCK_TICKERS", "AAPL,MSFT,TSLA,GOOGL,AMZN")
-    tickers = [t.strip() for t in tickers_str.split(",") if t.strip()]
+    tickers = list(get_tickers())
     
-    predictions = []
-
-    for ticker in tickers:
+    def download_ticker(ticker):
         try:
             # Download processed data
-            blob_name = f"{ticker}_processed.csv"
-            blob_client = blob_service_client.get_blob_client(container=processed_container, blob=blob_name)
+            blob_name = f"{ticker}_processed.parquet"
+            content = download_blob_bytes(blob_service_client, processed_container, blob_name)
             
-            if not blob_client.exists():
-                continue
+            if content is None:
+                return None
 
-            download_stream = blob_client.download_blob()
-            df = pd.read_csv(StringIO(download_stream.content_as_text()), index_col=0)
-            
-            pred_price = train_and_predict(df, ticker)
+            # The model only trains on Close, so skip decoding the other columns
+            return pd.read_parquet(BytesIO(content), columns=["Close"])
+        except Exception as e:
+            logging.error(f"LSTM download error for {ticker}: {e}")
+            return None
+
+    if not tickers:
+        return
+
+    # Phase 1: fetch all blobs in parallel (I/O-bound)
+    with ThreadPoolExecutor(max_workers=len(tickers)) as executor:
+        frames = dict(zip(tickers, executor.map(download_ticker, tickers)))
+
+    # Phase 2: train serially, TensorFlow already saturates the CPU
+    # Predictions are written straight into the upload buffer as they are produced
+    output = BytesIO()
+    text_output = None
+    writer = None
+
+    # Built on the first model-cache miss, so runs served entirely from the cache skip it
+    shared_model = []
+
+    def get_shared_model():
+        if not shared_model:
+            model = build_model(LOOK_BACK)
+            shared_model.extend((model, model.get_weights()))
+        return shared_model
+
+    for ticker in tickers:
+        df = frames.get(ticker)
+        if df is None:
+            continue
+
+        try:
+            pred_price = train_and_predict(df, ticker, blob_service_client, processed_container,
+                                           get_model=get_shared_model)
             
             if pred_price:
                 current_price = df["Close"].iloc[-1]
                 direction = "UP" if pred_price > current_price else "DOWN"
                 pct_change = ((pred_price - current_price) / current_price) * 100
                 
-                predictions.append({
+                row = {
                     "Ticker": ticker, 
                     "Current Price": current_price,
                     "Predicted 1D Price": pred_price,
                     "Direction": direction,
                     "Predicted % Change": pct_change,
                     "Date": pd.Timestamp.now().strftime("%Y-%m-%d")
-                })
+                }
+                if writer is None:
+                    text_output = TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+                    writer = csv.DictWriter(text_output, fieldnames=list(row.keys()), lineterminator="\n")
+                    writer.writeheader()
+                writer.writerow(row)
                 logging.info(f"LSTM Prediction for {ticker}: {pred_price:.2f} ({direction})")
             
         except Exception as e:
             logging.error(f"LSTM error for {ticker}: {e}")
 
     # Save predictions
-    if predictions:
-        pred_df = pd.DataFrame(predictions)
-        output = StringIO()
-        pred_df.to_csv(output, index=False)
+    if writer:
+        text_output.detach()  # Leave `output` open for getvalue()
         
         target_blob_client = blob_service_client.get_blob_client(container=processed_container, blob="lstm_predictions.csv")
-        target_blob_client.upload_blob(output.getvalue().encode("utf-8"), overwrite=True)
+        target_blob_client.upload_blob(output.getvalue(), overwrite=True)
         logging.info("Successfully uploaded lstm_predictions.csv to Azure.")
@@ -1,77 +1,222 @@
 import yfinance as yf
 import requests
 import pandas as pd
+import numpy as np
 from azure.storage.blob import BlobServiceClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
 import os
 from dotenv import load_dotenv
 import io
+import asyncio
 import logging
+import random
 import time
 from . import ai_insights
+from .azure_clients import create_blob_service_client
+from .config import get_tickers
+from .yf_session import get_yf_session
 from . import lstm_predictor
 
+try:
+    from yfinance.exceptions import YFRateLimitError
+except ImportError:  # older yfinance without a dedicated rate-limit error
+    class YFRateLimitError(Exception):
+        pass
+
 # Configure logging once at module level
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+MAX_DOWNLOAD_ATTEMPTS = 4
+# yfinance records these in yf.shared._ERRORS when it swallows a throttled request
+RATE_LIMIT_MARKERS = ("ratelimit", "rate limit", "too many requests")
 
 
-def fetch_stock_data(ticker: str) -> pd.DataFrame:
-    """Fetch daily stock data for a given ticker from Yahoo Finance."""
-    logging.info(f"Fetching data for {ticker} from Yahoo Finance...")
-    
-    # Download data with auto_adjust=True to get split/dividend adjusted prices
-    try:
-        df = yf.download(ticker, period="5y", interval="1d", auto_adjust=True, progress=False)
-        
-        if df.empty:
-            logging.warning(f"No data found for {ticker}")
-            return pd.DataFrame()
-
-        # Ensure we have standard columns
-        # yfinance columns: Open, High, Low, Close, Volume
-        # If multi-level columns (Ticker), drop the level
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.droplevel(1)
-            
-        # Select and order columns matches existing pipeline expectations
-        required_cols = ["Open", "High", "Low", "Close", "Volume"]
-        # Filter for existing columns only just in case
-        available_cols = [c for c in required_cols if c in df.columns]
-        df = df[available_cols]
-        
+def _is_rate_limited(e: Exception) -> bool:
+    if isinstance(e, YFRateLimitError):
+        return True
+    return isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 429
+
+
+def _is_rate_limit_message(message) -> bool:
+    message = str(message or "").lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def _extract_ticker(data: pd.DataFrame, tkr: str, n_requested: int):
+    """One ticker's rows from a (possibly grouped) yf.download frame, or None if it has no data."""
+    if isinstance(data.columns, pd.MultiIndex):
+        if tkr not in data.columns.get_level_values(0):
+            return None
+        df_raw = data.xs(tkr, axis=1, level=0)
+    elif n_requested == 1:
+        # Single-ticker downloads may come back without the ticker level
+        df_raw = data
+    else:
+        return None
+    df_raw = df_raw.dropna(how="all")
+    return None if df_raw.empty else df_raw
+
+
+def download_with_backoff(tickers: list, **kwargs) -> dict:
+    """
+    yf.download for several tickers that only waits when Yahoo actually throttles, with randomized
+    exponential backoff. yfinance logs per-ticker failures into yf.shared._ERRORS instead of raising,
+    so tickers that came back throttled (or empty without any recorded error) are re-downloaded.
+    Returns {ticker: raw frame} for every ticker that returned data.
+    """
+    frames = {}
+    pending = list(tickers)
+    for attempt in range(MAX_DOWNLOAD_ATTEMPTS):
+        try:
+            data = yf.download(tickers=" ".join(pending), **kwargs)
+            errors = dict(getattr(yf.shared, "_ERRORS", {}) or {})
+        except Exception as e:
+            if not _is_rate_limited(e) or attempt == MAX_DOWNLOAD_ATTEMPTS - 1:
+                raise
+            throttled = pending
+        else:
+            throttled = []
+            for tkr in pending:
+                df_raw = _extract_ticker(data, tkr, len(pending))
+                if df_raw is not None:
+                    frames[tkr] = df_raw
+                    continue
+                error = errors.get(tkr.upper(), errors.get(tkr))
+                if error is None or _is_rate_limit_message(error):
+                    throttled.append(tkr)
+                else:
+                    logging.warning(f"yfinance failed for {tkr}: {error}")
+
+        if not throttled:
+            break
+        if attempt == MAX_DOWNLOAD_ATTEMPTS - 1:
+            logging.error(f"Still rate limited by Yahoo Finance for {', '.join(throttled)}, giving up.")
+            break
+        delay = random.uniform(3, 5) * 2 ** attempt
+        logging.warning(f"Rate limited by Yahoo Finance for {', '.join(throttled)}, retrying in {delay:.1f}s...")
+        time.sleep(delay)
+        pending = throttled
+    return frames
+
+
+def adjust_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """Apply split/dividend adjustment (Adj Close / Close ratio) to OHLC in one NumPy pass."""
+    if "Adj Close" not in df.columns:
         return df
+    ratio = df["Adj Close"].to_numpy(dtype=np.float64) / df["Close"].to_numpy(dtype=np.float64)
+    df = df.drop(columns="Adj Close")
+    for col in ("Open", "High", "Low", "Close"):
+        if col in df.columns:
+            df[col] = df[col].to_numpy(dtype=np.float64) * ratio
+    return df
+
 
+def fetch_stock_data_batch(tickers: list) -> dict:
+    """Fetch daily stock data for all tickers in a single Yahoo Finance request."""
+    logging.info(f"Fetching data for {', '.join(tickers)} from Yahoo Finance...")
+
+    try:
+        raw = download_with_backoff(tickers, period="5y", interval="1d", auto_adjust=False,
+                                    group_by="ticker", threads=True, progress=False, session=get_yf_session())
     except Exception as e:
-        logging.error(f"Error fetching {ticker} from yfinance: {e}")
-        return pd.DataFrame()
+        logging.error(f"Error fetching {tickers} from yfinance: {e}")
+        return {}
+
+    required_cols = ["Open", "High", "Low", "Close", "Volume"]
+    frames = {}
+    for tkr in tickers:
+        if tkr not in raw:
+            logging.warning(f"No data found for {tkr}")
+            continue
 
+        df_raw = adjust_prices(raw[tkr])
+
+        # Select and order columns matches existing pipeline expectations
+        frames[tkr] = df_raw[[c for c in required_cols if c in df_raw.columns]]
 
-def upload_to_azure(blob_service_client: BlobServiceClient, container: str, blob_name: str, df: pd.DataFrame, include_index=False):
-    """Upload a DataFrame to Azure Blob Storage."""
-    output = io.StringIO()
-    df.to_csv(output, index=include_index)
-    blob_client = blob_service_client.get_blob_client(container=container, blob=blob_name)
-    blob_client.upload_blob(output.getvalue().encode("utf-8"), overwrite=True)
+    return frames
+
+
+# Free upload buffers, reused across uploads. A buffer is owned by one upload until
+# released, so concurrent uploads never share one; the pool grows to the peak concurrency.
+_BUFFERS = []
+
+
+def _acquire_buffer() -> io.BytesIO:
+    return _BUFFERS.pop() if _BUFFERS else io.BytesIO()
+
+
+def _release_buffer(buf: io.BytesIO):
+    _BUFFERS.append(buf)
+
+
+async def upload_to_azure(blob_service_client: AsyncBlobServiceClient, container: str, blob_name: str, df: pd.DataFrame, include_index=False):
+    """Upload a DataFrame to Azure Blob Storage as Snappy-compressed Parquet."""
+    output = _acquire_buffer()
+    try:
+        # Overwrite from the start so the buffer keeps its capacity. Nothing is truncated (that
+        # can release the storage); `length` stops the upload before any previous payload's tail.
+        output.seek(0)
+        df.to_parquet(output, engine="pyarrow", compression="snappy", index=include_index)
+        length = output.tell()
+        output.seek(0)
+        # Hand the buffer itself to the SDK (chunked upload) rather than copying it to bytes
+        blob_client = blob_service_client.get_blob_client(container=container, blob=blob_name)
+        await blob_client.upload_blob(output, overwrite=True, length=length)
+    finally:
+        _release_buffer(output)
     logging.info(f"Uploaded {blob_name} to container '{container}'.")
 
 
 def transform_data(df: pd.DataFrame) -> pd.DataFrame:
     """Transform raw stock data into processed format."""
-    df_transformed = df.copy()
-    df_transformed["return_pct"] = df_transformed["Close"].pct_change()
-    df_transformed.reset_index(inplace=True)
-    return df_transformed
+    # Daily return in one NumPy pass
+    close = df["Close"].to_numpy(dtype=np.float64)
+    ret = np.empty_like(close)
+    ret[:1] = np.nan
+    np.subtract(np.divide(close[1:], close[:-1]), 1.0, out=ret[1:])
+
+    # Build the output in one construction instead of copy + column add + reset_index
+    columns = {"Date": df.index.to_numpy()}
+    for col in df.columns:
+        columns[col] = df[col].to_numpy(copy=False)
+    columns["return_pct"] = ret
+    return pd.DataFrame(columns)
 
 
-def main():
-    """Main ETL pipeline logic."""
+async def process_ticker(blob_service_client: AsyncBlobServiceClient, raw_container: str, processed_container: str, ticker: str, df_raw: pd.DataFrame):
+    """Transform one ticker and upload its raw and processed blobs concurrently."""
+    df_processed = transform_data(df_raw)
+    await asyncio.gather(
+        upload_to_azure(blob_service_client, raw_container, f"{ticker}_raw.parquet", df_raw, include_index=True),
+        upload_to_azure(blob_service_client, processed_container, f"{ticker}_processed.parquet", df_processed),
+    )
+
+
+async def upload_all_async(connection_string: str, raw_container: str, processed_container: str, raw_data: dict):
+    """Upload every ticker over one async client, at most ETL_MAX_WORKERS tickers in flight."""
+    semaphore = asyncio.Semaphore(max(1, int(os.getenv("ETL_MAX_WORKERS", "16"))))
+
+    async def run_one(client, ticker, df_raw):
+        async with semaphore:
+            try:
+                await process_ticker(client, raw_container, processed_container, ticker, df_raw)
+            except Exception as e:
+                logging.error(f"Error processing {ticker}: {e}", exc_info=True)
+
+    # One client so all PUTs share its connection pool
+    async with AsyncBlobServiceClient.from_connection_string(connection_string) as client:
+        await asyncio.gather(*(run_one(client, ticker, df_raw) for ticker, df_raw in raw_data.items()))
+
+
+def main(blob_service_client: BlobServiceClient = None):
+    """Main ETL pipeline logic. Reuses `blob_service_client` if the caller already has one."""
     logging.info("Starting ETL pipeline...")
 
     load_dotenv()  # only works locally, ignored in Azure
     raw_container = os.getenv("RAW_CONTAINER_NAME", "rawdata")
     processed_container = os.getenv("PROCESSED_CONTAINER_NAME", "processeddata")
-    tickers_str = os.getenv("STOCK_TICKERS", "AAPL,MSFT,TSLA,GOOGL,AMZN")
-    tickers = [t.strip() for t in tickers_str.split(",") if t.strip()]
+    tickers = list(get_tickers())
     # API Key no longer needed for yfinance
 
     connection_string = os.getenv("AZURE_CONNECTION_STRING") or os.getenv("CONNECTION_STRING")
@@ -79,23 +224,17 @@ def main():
         logging.error("AZURE_CONNECTION_STRING not found in environment variables.")
         raise ValueError("Azure connection string not found.")
 
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-
-    for ticker in tickers:
-        try:
-            df_raw = fetch_stock_data(ticker)
-            if df_raw.empty:
-                continue
+    if blob_service_client is None:
+        blob_service_client = create_blob_service_client(connection_string)
 
-            upload_to_azure(blob_service_client, raw_container, f"{ticker}_raw.csv", df_raw, include_index=True)
+    # One request for every ticker instead of one (plus a rate-limit sleep) per ticker
+    raw_data = fetch_stock_data_batch(tickers)
 
-            df_processed = transform_data(df_raw)
-            upload_to_azure(blob_service_client, processed_container, f"{ticker}_processed.csv", df_processed)
-
-            # Avoid hitting rate limits
-            time.sleep(15)
-        except Exception as e:
-            logging.error(f"Error processing {ticker}: {e}", exc_info=True)
+    # Overlap all Azure PUTs on one event loop instead of blocking on each
+    if raw_data:
+        asyncio.run(upload_all_async(connection_string, raw_container, processed_container, raw_data))
+    else:
+        logging.error("No data fetched from Yahoo Finance; nothing was uploaded.")
 
     logging.info("ETL pipeline completed successfully.")
     
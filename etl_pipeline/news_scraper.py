@@ -1,8 +1,27 @@
 import yfinance as yf
 import pandas as pd
 import logging
-from textblob import TextBlob
+import os
+import functools
+import warnings
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from datetime import datetime
+from .yf_session import get_yf_session
+from .config import get_tickers
+
+# One analyzer per process so the lexicon is loaded once, not per headline
+_SIA = SentimentIntensityAnalyzer()
+
+# Headlines shorter than this carry too little signal to score
+MIN_TITLE_LENGTH = 8
+
+@functools.lru_cache(maxsize=4096)
+def _score(title: str):
+    """(compound, subjectivity) for a headline; cached since wire stories repeat across tickers."""
+    scores = _SIA.polarity_scores(title)
+    # Compound: -1.0 (Negative) to 1.0 (Positive)
+    # Subjectivity approximation: 0.0 (all neutral words) to 1.0 (all polar words)
+    return scores["compound"], 1.0 - scores["neu"]
 
 def fetch_and_analyze_news(ticker: str, limit=5):
     """
@@ -10,10 +29,11 @@ def fetch_and_analyze_news(ticker: str, limit=5):
     Returns a list of dictionaries with title, link, and sentiment score.
     """
     try:
-        stock = yf.Ticker(ticker)
+        stock = yf.Ticker(ticker, session=get_yf_session())
         news_items = stock.news
         
-        results = []
+        results = [None] * min(limit, len(news_items))
+        count = 0
         
         for item in news_items[:limit]:
             # Extract fields based on the raw structure we observed
@@ -24,35 +44,33 @@ def fetch_and_analyze_news(ticker: str, limit=5):
             link_obj = content.get('clickThroughUrl')
             link = link_obj.get('url') if link_obj else None
             
-            if not title:
+            if not title or len(title) < MIN_TITLE_LENGTH:
                 continue
                 
-            # Calculate Sentiment
-            # Polarity: -1.0 (Negative) to 1.0 (Positive)
-            blob = TextBlob(title)
-            sentiment_score = blob.sentiment.polarity
-            
-            # Subjectivity: 0.0 (Objective) to 1.0 (Subjective)
-            subjectivity = blob.sentiment.subjectivity
+            # Calculate Sentiment (VADER)
+            sentiment_score, subjectivity = _score(title)
             
-            results.append({
+            results[count] = {
                 "ticker": ticker,
                 "title": title,
                 "link": link,
                 "sentiment_score": sentiment_score,
-                "sentiment_label": "POSITIVE" if sentiment_score > 0.1 else "NEGATIVE" if sentiment_score < -0.1 else "NEUTRAL",
+                "sentiment_label": "POSITIVE" if sentiment_score >= 0.05 else "NEGATIVE" if sentiment_score <= -0.05 else "NEUTRAL",
                 "subjectivity": subjectivity,
                 "fetched_at": datetime.utcnow().isoformat()
-            })
+            }
+            count += 1
             
-        return results
+        return results[:count]
 
     except Exception as e:
+        # Surface the failure to callers as well as the log; the pipeline carries on with []
+        warnings.warn(f"Error fetching news for {ticker}: {e}")
         logging.error(f"Error fetching news for {ticker}: {e}")
         return []
 
-import os
-from io import StringIO
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from azure.storage.blob import BlobServiceClient
 
 def run_sentiment_pipeline(blob_service_client: BlobServiceClient, processed_container: str):
@@ -61,33 +79,36 @@ def run_sentiment_pipeline(blob_service_client: BlobServiceClient, processed_con
     """
     logging.info("Starting News Sentiment Analysis Pipeline...")
     
-    tickers_str = os.getenv("STOCK_TICKERS", "AAPL,MSFT,TSLA,GOOGL,AMZN")
-    tickers = [t.strip() for t in tickers_str.split(",") if t.strip()]
+    tickers = list(get_tickers())
     
     all_news = []
     
-    for ticker in tickers:
-        try:
-            news_items = fetch_and_analyze_news(ticker)
-            if news_items:
-                all_news.extend(news_items)
-                logging.info(f"Fetched {len(news_items)} news items for {ticker}")
-            else:
-                logging.warning(f"No news found for {ticker}")
-        except Exception as e:
-            logging.error(f"Error in sentiment pipeline for {ticker}: {e}")
+    # Each ticker's news request is a blocking HTTPS call, so fetch them concurrently
+    max_workers = max(1, int(os.getenv("NEWS_MAX_WORKERS", "8")))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # fetch_and_analyze_news handles its own errors, so one bad ticker can't fail the batch
+        results = list(zip(tickers, executor.map(fetch_and_analyze_news, tickers)))
+    
+    for ticker, news_items in results:
+        if news_items:
+            all_news.extend(news_items)
+            logging.info(f"Fetched {len(news_items)} news items for {ticker}")
+        else:
+            logging.warning(f"No news found for {ticker}")
             
     if all_news:
         df = pd.DataFrame(all_news)
         
         # Save to CSV in memory
-        output = StringIO()
-        df.to_csv(output, index=False)
+        output = BytesIO()
+        df.to_csv(output, index=False, encoding="utf-8")
+        length = output.tell()
+        output.seek(0)
         
         # Upload to Azure
         try:
             blob_client = blob_service_client.get_blob_client(container=processed_container, blob="sentiment_analysis.csv")
-            blob_client.upload_blob(output.getvalue().encode("utf-8"), overwrite=True)
+            blob_client.upload_blob(output, overwrite=True, length=length)
             logging.info("Successfully uploaded sentiment_analysis.csv to Azure.")
         except Exception as e:
             logging.error(f"Failed to upload sentiment CSV: {e}")
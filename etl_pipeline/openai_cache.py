@@ -0,0 +1,56 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shelve
+import threading
+
+# Disk cache of OpenAI completions keyed by a hash of the request payload.
+CACHE_PATH = os.getenv("OPENAI_CACHE_PATH", "/tmp/finsight_openai.cache")
+_LOCK = threading.Lock()
+
+def completion_cache_key(model: str, messages: list, max_tokens: int) -> str:
+    """Stable hash of everything that determines a completion."""
+    payload = json.dumps({"m": model, "msgs": messages, "mt": max_tokens}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _cache_get(key: str):
+    try:
+        with _LOCK, shelve.open(CACHE_PATH) as db:
+            return db.get(key)
+    except Exception as e:
+        logging.warning(f"OpenAI cache read failed: {e}")
+        return None
+
+def _cache_put(key: str, content: str):
+    try:
+        with _LOCK, shelve.open(CACHE_PATH) as db:
+            db[key] = content
+    except Exception as e:
+        logging.warning(f"OpenAI cache write failed: {e}")
+
+def cached_completion(client, model: str, messages: list, max_tokens: int) -> str:
+    """Return the completion text, calling OpenAI only on a cache miss."""
+    key = completion_cache_key(model, messages, max_tokens)
+    content = _cache_get(key)
+    if content is not None:
+        return content
+
+    response = client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens)
+    content = response.choices[0].message.content
+    _cache_put(key, content)
+    return content
+
+async def cached_completion_async(aclient, model: str, messages: list, max_tokens: int) -> str:
+    """Async variant of cached_completion for AsyncOpenAI clients."""
+    key = completion_cache_key(model, messages, max_tokens)
+    # shelve I/O blocks (and serializes on _LOCK); keep it off the event loop so gathered calls overlap
+    content = await asyncio.to_thread(_cache_get, key)
+    if content is not None:
+        return content
+
+    response = await aclient.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens)
+    content = response.choices[0].message.content
+    await asyncio.to_thread(_cache_put, key, content)
+    return content
@@ -0,0 +1,17 @@
+import logging
+
+# One HTTP session shared by every yfinance call so downloads and news lookups reuse pooled,
+# kept-alive TLS connections. yfinance >= 0.2.54 only accepts curl_cffi sessions (plain
+# requests / requests_cache sessions are rejected), so responses are not cached on disk.
+_SESSION = None
+
+def get_yf_session():
+    """Return the process-wide curl_cffi session, or None to use yfinance's default."""
+    global _SESSION
+    if _SESSION is None:
+        try:
+            from curl_cffi import requests as curl_requests
+            _SESSION = curl_requests.Session(impersonate="chrome")
+        except ImportError:
+            logging.warning("curl_cffi not installed. yfinance will manage its own session.")
+    return _SESSION
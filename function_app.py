@@ -1,22 +1,43 @@
 import datetime
 import logging
+import os
 import azure.functions as func
 # from etl_pipeline import main as etl_main
 
 app = func.FunctionApp()
 
 
+def _create_blob_client():
+    """Build the Blob client once per worker; None if not configured (main() reports it)."""
+    from etl_pipeline.azure_clients import create_blob_service_client
+    connection_string = os.getenv("AZURE_CONNECTION_STRING") or os.getenv("CONNECTION_STRING")
+    if not connection_string:
+        return None
+    try:
+        return create_blob_service_client(connection_string)
+    except Exception as e:
+        logging.error(f"Could not create BlobServiceClient: {e}")
+        return None
+
+
+# Created on the first run and reused across timer invocations on a warm worker
+BLOB_CLIENT = None
+
+
 @app.function_name(name="FinSightETLTimer")
 @app.schedule(schedule="0 0 */6 * * *", arg_name="mytimer", run_on_startup=False, use_monitor=False)
 def run_etl(mytimer: func.TimerRequest) -> None:
     """Azure Function timer trigger to run the ETL pipeline."""
+    global BLOB_CLIENT
     utc_timestamp = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
     logging.info(f"FinSight ETL Timer triggered at {utc_timestamp}")
 
     try:
         # Lazy load the pipeline to prevent Discovery/Import errors
         from etl_pipeline import main as etl_main
-        etl_main.main()
+        if BLOB_CLIENT is None:
+            BLOB_CLIENT = _create_blob_client()
+        etl_main.main(BLOB_CLIENT)
         logging.info("ETL pipeline executed successfully.")
     except Exception as e:
         logging.error(f"ETL execution failed: {e}", exc_info=True)